@@ -0,0 +1,46 @@
+"""
+Asynchronous connection to QAI, it requires httpx installed with http2 support.
+"""
+import asyncio
+
+import httpx
+
+from qingcloud.qai.connection import QAIConnection
+
+
+class QAIAsyncConnection(QAIConnection):
+    """
+    Asynchronous connection to QAI.
+    It has the same methods as QAIConnection, each returns an awaitable. Concurrent requests are
+    multiplexed over the HTTP/2 connections of one httpx.AsyncClient.
+    """
+
+    def _create_session(self):
+        return httpx.AsyncClient(http2=True, limits=httpx.Limits(max_connections=self._pool_size))
+
+    # send_request of QAIConnection returns this coroutine, so every API method is awaitable.
+    async def _send(self, method, path, headers, data, timeout):
+        try:
+            response = await self._session.request(method, path, headers=headers, content=data, timeout=timeout)
+            return response.content
+        except httpx.TimeoutException as e:
+            raise Exception("Connection timed out.") from e
+        except httpx.HTTPError as e:
+            raise Exception("Connection failed.") from e
+
+    async def send_requests(self, specs):
+        """
+        Send several requests to QAI concurrently.
+        @param specs: A list of dicts, each holding the keyword arguments of send_request.
+        @return: The raw response bodies as bytes, in the same order as specs.
+        """
+        return list(await asyncio.gather(*(self.send_request(**spec) for spec in specs)))
+
+    async def close(self):
+        await self._session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,61 +1,135 @@
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import hashlib
+import heapq
 import base64
+import binascii
 import hmac
-from collections import OrderedDict
+import json
 from hashlib import sha256
 from urllib import parse
 
 import qingcloud.qai
-from qingcloud.misc.json_tool import json_dump
 from qingcloud.qai.constants import GET_TRAINS, WORK_GROUP, TRAINS_METRICS, GET_RESOURCE_GROUP, SHARE_RESOURCE_GROUP
 
+# MD5 of the empty request body, which is part of every string to sign.
+_EMPTY_MD5_HEX = b"d41d8cd98f00b204e9800998ecf8427e"
+# Headers sent with every request, never mutated in place.
+_DEFAULT_HEADERS = {"Channel": "api"}
+# RFC 3986 unreserved bytes are kept as is, every other byte maps to its %XX escape.
+_UNRESERVED = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_.~"
+_QUOTE_TABLE = tuple(chr(b) if b in _UNRESERVED else "%%%02X" % b for b in range(256))
+_JSON_HEADERS = {**_DEFAULT_HEADERS, "Content-Type": "application/json"}
+
+# Sorted param names signed by each endpoint, so the signer does not sort them per request.
+_GET_USER_INFO_KEYS = ('zone',)
+_GET_RESOURCE_GROUPS_KEYS = ('limit', 'offset', 'order_by', 'reverse', 'search_word', 'zone')
+_GET_SHARE_USERS_KEYS = ('limit', 'offset', 'rg_id', 'zone')
+_SHARE_RESOURCE_GROUP_KEYS = ('zone',)
+_REMOVE_SHARED_RESOURCE_GROUP_KEYS = ('is_all', 'rg_id', 'share_user_ids', 'zone')
+_GET_TRAINS_KEYS = ('end_at', 'endpoints', 'image_name', 'limit', 'name', 'namespace', 'offset', 'order_by',
+                    'owner', 'reverse', 'start_at', 'status', 'zone')
+_TRAINS_METRICS_KEYS = ('namespace', 'resource_ids', 'zone')
+
 
 class QAIConnection():
     """
     Public connection to QAI.
     """
     def __init__(self, qy_access_key_id, qy_secret_access_key, zone, host="ai.coreshub.cn", port=443,
-                 protocol="https"):
+                 protocol="https", pool_size=10):
+        """
+        @param pool_size: The number of keep-alive connections kept in the session pool.
+        """
         self.qy_access_key_id = qy_access_key_id
         self.qy_secret_access_key = qy_secret_access_key
         self.zone = zone
         self.host = host
         self.port = port
         self.protocol = protocol
+        # The HMAC key schedule only depends on the secret key, signing copies this prepared state.
+        self._hmac_template = hmac.new(qy_secret_access_key.encode("utf-8"), digestmod=sha256)
+        self._base_url = f"{protocol}://{host}:{port}"
+        self._pool_size = pool_size
+        self._session = self._create_session()
+
+    def _create_session(self):
+        # Reuse pooled connections across calls instead of a new TCP/TLS handshake per request.
+        # Read errors are not retried, so a read timeout still surfaces as requests' ReadTimeout.
+        retry = Retry(total=2, read=False, backoff_factor=0.1)
+        session = requests.Session()
+        session.mount(self.protocol + "://", HTTPAdapter(pool_connections=self._pool_size,
+                                                         pool_maxsize=self._pool_size,
+                                                         max_retries=retry))
+        return session
 
-    # Send request to QAI.
-    def send_request(self, url="", method="", params=None, body=None, headers=None, timeout=5):
-        if headers:
-            headers["Channel"] = "api"
+    def _prepare_request(self, url, method, params, body, headers, sign_keys=None):
+        """
+        Sign a request and return its full path, headers and encoded body.
+        """
+        if sign_keys is None:
+            signature = QAISignatureAuthHandler.generate_signature(method=method, url=url, ak=self.qy_access_key_id,
+                                                                   sk=self._hmac_template,
+                                                                   params=params)
+        else:
+            signature = QAISignatureAuthHandler.generate_signature_with_keys(method=method, url=url,
+                                                                             ak=self.qy_access_key_id,
+                                                                             sk=self._hmac_template,
+                                                                             keys=sign_keys, params=params)
+        path = self._base_url + url + "?" + signature
+        data = None
+        if method == "POST" and body is not None:
+            # Serialize once here rather than through the json= handling of requests,
+            # json.dumps raises TypeError on bodies it cannot serialize.
+            data = json.dumps(body, separators=(',', ':'), sort_keys=True).encode("utf-8")
+            headers = {**headers, **_JSON_HEADERS} if headers else _JSON_HEADERS
         else:
-            headers = {"Channel": "api"}
-        signature = QAISignatureAuthHandler.generate_signature(method=method, url=url, ak=self.qy_access_key_id,
-                                                               sk=self.qy_secret_access_key,
-                                                               params=params)
+            headers = {**headers, **_DEFAULT_HEADERS} if headers else _DEFAULT_HEADERS
+        return path, headers, data
+
+    # Send request to QAI, return the raw response body as bytes.
+    # sign_keys optionally gives the sorted names of params, see generate_signature_with_keys.
+    def send_request(self, url="", method="", params=None, body=None, headers=None, timeout=5, sign_keys=None):
+        path, headers, data = self._prepare_request(url, method, params, body, headers, sign_keys)
+        return self._send(method, path, headers, data, timeout)
+
+    def _send(self, method, path, headers, data, timeout):
         try:
-            if method == "GET":
-                path = f"{self.protocol}://{self.host}:{self.port}{url}?{signature}"
-                response = requests.get(path, headers=headers, timeout=timeout)
-                return response.text
-            if method == "POST":
-                path = f"{self.protocol}://{self.host}:{self.port}{url}?{signature}"
-                response = requests.post(path, headers=headers, json=body, timeout=timeout)
-                return response.text
-            if method == "DELETE":
-                path = f"{self.protocol}://{self.host}:{self.port}{url}?{signature}"
-                response = requests.delete(path, headers=headers, timeout=timeout)
-                return response.text
-        except requests.exceptions.Timeout:
-            print("Connection timed out.")
-            raise Exception("Connection timed out.")
-        except requests.exceptions.RequestException:
-            print("Connection failed.")
-            raise Exception("Connection failed.")
-        except Exception as e:
-            raise e
+            response = self._session.request(method, path, headers=headers, data=data, timeout=timeout)
+            return response.content
+        except requests.exceptions.Timeout as e:
+            raise Exception("Connection timed out.") from e
+        except requests.exceptions.RequestException as e:
+            raise Exception("Connection failed.") from e
+
+    def send_requests(self, specs):
+        """
+        Send several requests to QAI concurrently over the pooled session.
+        @param specs: A list of dicts, each holding the keyword arguments of send_request.
+        @return: The raw response bodies as bytes, in the same order as specs.
+        """
+        if not specs:
+            return []
+        # Sign and encode every spec before sending any, so an invalid spec fails the whole batch
+        # with nothing on the wire. Signing is cheap and CPU bound, only the round trips run in the pool.
+        requests_args = []
+        for spec in specs:
+            method = spec.get("method", "")
+            path, headers, data = self._prepare_request(spec.get("url", ""), method, spec.get("params"),
+                                                        spec.get("body"), spec.get("headers"),
+                                                        spec.get("sign_keys"))
+            requests_args.append((method, path, headers, data, spec.get("timeout", 5)))
+        results = [None] * len(specs)
+        with ThreadPoolExecutor(max_workers=min(len(specs), self._pool_size)) as executor:
+            futures = {executor.submit(self._send, *args): index for index, args in enumerate(requests_args)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
 
     # User
     def get_user_info(self):
@@ -63,7 +137,7 @@ class QAIConnection():
         params = {
             'zone': self.zone
         }
-        resp = self.send_request(url=url, method="GET", params=params)
+        resp = self.send_request(url=url, method="GET", params=params, sign_keys=_GET_USER_INFO_KEYS)
         return resp
 
     # Resource Group
@@ -77,7 +151,7 @@ class QAIConnection():
             'order_by': order_by,
             'search_word': search_word
         }
-        resp = self.send_request(url=url, method="GET", params=params)
+        resp = self.send_request(url=url, method="GET", params=params, sign_keys=_GET_RESOURCE_GROUPS_KEYS)
         return resp
 
     def get_share_users(self, rg_id: str = "", offset: int = 0, limit: int = 20):
@@ -88,7 +162,7 @@ class QAIConnection():
             'offset': offset,
             'limit': limit,
         }
-        resp = self.send_request(url=url, method="GET", params=params)
+        resp = self.send_request(url=url, method="GET", params=params, sign_keys=_GET_SHARE_USERS_KEYS)
         return resp
 
     def share_resource_group(self, rg_id: str, is_all: int = 1, share_user_ids: Optional[List[str]] = []):
@@ -107,7 +181,7 @@ class QAIConnection():
             'is_all': is_all,
             'share_user_ids': share_user_ids
         }
-        resp = self.send_request(url=url, method="POST", params=params, body=body)
+        resp = self.send_request(url=url, method="POST", params=params, body=body, sign_keys=_SHARE_RESOURCE_GROUP_KEYS)
         return resp
 
     def remove_shared_resource_group(self, rg_id: str, is_all: int = 0, share_user_ids: Optional[List[str]] = []):
@@ -124,7 +198,7 @@ class QAIConnection():
             'is_all': is_all,
             'share_user_ids': share_user_ids
         }
-        resp = self.send_request(url=url, method="DELETE", params=params)
+        resp = self.send_request(url=url, method="DELETE", params=params, sign_keys=_REMOVE_SHARED_RESOURCE_GROUP_KEYS)
         return resp
 
     # Train
@@ -147,9 +221,7 @@ class QAIConnection():
             'end_at': end_at,
             'owner': owner
         }
-        # Remove keys with a value of None
-        params = {k: v for k, v in params.items() if v is not None}
-        resp = self.send_request(url=url, method="GET", params=params)
+        resp = self.send_request(url=url, method="GET", params=params, sign_keys=_GET_TRAINS_KEYS)
         return resp
 
     def trains_metrics(self, resource_ids: List[str], namespace: str = "ALL"):
@@ -161,9 +233,7 @@ class QAIConnection():
             'zone': self.zone,
             'resource_ids': resource_ids
         }
-        # Remove keys with a value of None
-        params = {k: v for k, v in params.items() if v is not None}
-        resp = self.send_request(url=url, method="GET", params=params)
+        resp = self.send_request(url=url, method="GET", params=params, sign_keys=_TRAINS_METRICS_KEYS)
         return resp
 
 
@@ -172,51 +242,123 @@ class QAISignatureAuthHandler():
     QAISignatureAuthHandler is used to authenticate QAI.
     """
     @staticmethod
-    def generate_signature(method: str, url: str, ak: str, sk: str, params: dict):
+    def generate_signature(method: str, url: str, ak: str, sk: Union[str, bytes, hmac.HMAC], params: dict):
         """
         :param url: /api/test/  must be end /
         :param ak: access_key_id
-        :param sk:  secure_key
-        :param params: dict type
+        :param sk:  secure_key, str, utf-8 encoded bytes or an hmac object prepared with it and sha256
+        :param params: dict type, None values are left out
         :param method: method GET POST PUT DELETE
         :return:
         """
         url += "/" if not url.endswith("/") else ""
-        params["access_key_id"] = ak
-        sorted_param = OrderedDict()
-        keys = sorted(params.keys())
-        for key in keys:
-            if isinstance(params[key], list):
-                sorted_param[key] = sorted(params[key])
-            else:
-                sorted_param[key] = params[key]
-
-        # generate url.
-        url_param_parts = []
-        for key, values in sorted_param.items():
-            if not isinstance(values, list):
-                url_param_parts.append(f"{key}={values}")
-            else:
-                for value in values:
-                    url_param_parts.append(f"{key}={value}")
-
-        url_param = '&'.join(url_param_parts)
-        string_to_sign = method + "\n" + url + "\n" + url_param + "\n" + hex_encode_md5_hash("")
-
-        h = hmac.new(sk.encode(encoding="utf-8"), digestmod=sha256)
-        h.update(string_to_sign.encode(encoding="utf-8"))
-        sign = base64.b64encode(h.digest()).strip()
-        signature = parse.quote_plus(sign)
+        # Sign a copy, the caller's params must not pick up access_key_id.
+        all_params = {**params, "access_key_id": ak} if params else {"access_key_id": ak}
+        url_param = _encode_items((key, all_params[key]) for key in sorted(all_params))
+        return QAISignatureAuthHandler._sign_url_param(method, url, url_param, sk)
+
+    @staticmethod
+    def generate_signature_with_keys(method: str, url: str, ak: str, sk: Union[str, bytes, hmac.HMAC], keys: tuple, params: dict):
+        """
+        Same as generate_signature, for endpoints whose param names are known ahead of time.
+        :param keys: the sorted names of params to sign, without access_key_id
+        :param params: dict type, missing keys and None values are left out
+        """
+        url += "/" if not url.endswith("/") else ""
+        items = [(key, params.get(key)) for key in keys]
+        items.insert(bisect_left(keys, "access_key_id"), ("access_key_id", ak))
+        url_param = _encode_items(items)
+        return QAISignatureAuthHandler._sign_url_param(method, url, url_param, sk)
+
+    @staticmethod
+    def prepare_signer(method: str, url: str, ak: str, sk: Union[str, bytes, hmac.HMAC], static_params: dict):
+        """
+        Prepare a signer for requests whose params are mostly fixed, such as polling the same endpoint.
+        :param static_params: params sent unchanged with every request, None values are left out
+        :return: a function taking the remaining params as a dict and returning the signed url params.
+                 Its keys must not repeat the keys of static_params, its None values are left out too.
+        """
+        url += "/" if not url.endswith("/") else ""
+        if not isinstance(sk, hmac.HMAC):
+            sk = hmac.new(sk.encode("utf-8") if isinstance(sk, str) else sk, digestmod=sha256)
+        # Encode each static param to its "key=value" pieces once, sign() only encodes the params passed to it.
+        static_pieces = sorted(_encoded_pieces({**static_params, "access_key_id": ak}))
+        static_url_param = "&".join(piece for _, piece in static_pieces)
+
+        def sign(params=None):
+            url_param = static_url_param
+            if params:
+                url_param = "&".join(piece for _, piece in heapq.merge(static_pieces,
+                                                                       sorted(_encoded_pieces(params))))
+            return QAISignatureAuthHandler._sign_url_param(method, url, url_param, sk)
+
+        return sign
+
+    @staticmethod
+    def _sign_url_param(method, url, url_param, sk):
+        # url_param is fully percent-encoded, hence plain ascii.
+        string_to_sign = b"\n".join((method.encode("utf-8"), url.encode("utf-8"), url_param.encode("ascii"),
+                                     _EMPTY_MD5_HEX))
+
+        if isinstance(sk, hmac.HMAC):
+            h = sk.copy()
+            h.update(string_to_sign)
+            digest = h.digest()
+        else:
+            if isinstance(sk, str):
+                sk = sk.encode("utf-8")
+            digest = hmac.digest(sk, string_to_sign, "sha256")
+        # base64 of a 32-byte digest never carries whitespace, quote_plus takes the bytes as is.
+        signature = parse.quote_plus(base64.b64encode(digest))
         url_param += "&signature=%s" % signature
         return url_param
 
 
+def _encode_items(items):
+    """
+    Build the canonical query of (key, value) items already sorted by key: list values sorted and
+    expanded to one "key=value" pair per item, keys and values percent-encoded, None values left out.
+    Every signing path encodes through this function, so a compiled implementation can replace it alone.
+    """
+    # Same output as parse.urlencode(items, doseq=True, quote_via=parse.quote) with list values sorted,
+    # without its per-item type dispatch, so encoding a single item stays cheap for prepare_signer.
+    pieces = []
+    for key, value in items:
+        if value is None:
+            continue
+        key = _quote(key) + "="
+        if isinstance(value, (list, tuple)):
+            for item in (sorted(value) if isinstance(value, list) else value):
+                pieces.append(key + _quote(item if isinstance(item, (str, bytes)) else str(item)))
+        else:
+            pieces.append(key + _quote(value if isinstance(value, (str, bytes)) else str(value)))
+    return "&".join(pieces)
+
+
+def _encoded_pieces(params):
+    # (key, "key=value" pieces) of each param, leaving out params that encode to nothing.
+    pieces = []
+    for key, value in params.items():
+        piece = _encode_items(((key, value),))
+        if piece:
+            pieces.append((key, piece))
+    return pieces
+
+
+def _quote(string):
+    # Same result as parse.quote(string, safe="") only, every byte outside _UNRESERVED is escaped.
+    # Encoded by table lookup instead of per-byte Python calls.
+    if isinstance(string, str):
+        string = string.encode("utf-8")
+    if not string.translate(None, _UNRESERVED):
+        return string.decode("ascii")
+    return "".join(map(_QUOTE_TABLE.__getitem__, string))
+
+
 def hex_encode_md5_hash(data):
+    """
+    Return the hex MD5 digest of the str data, as ascii bytes.
+    """
     if not data:
-        data = "".encode("utf-8")
-    else:
-        data = data.encode("utf-8")
-    md5 = hashlib.md5()
-    md5.update(data)
-    return md5.hexdigest()
-
+        return _EMPTY_MD5_HEX
+    return binascii.hexlify(hashlib.md5(data.encode("utf-8")).digest())
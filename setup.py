@@ -26,5 +26,6 @@ setup(
     package_dir={'qingcloud-sdk': 'qingcloud'},
     namespace_packages=['qingcloud'],
     include_package_data=True,
-    install_requires=['future', 'requests']
+    install_requires=['future', 'requests'],
+    extras_require={'async': ['httpx[http2]']}
 )
@@ -0,0 +1,62 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import asyncio
+import unittest
+
+try:
+    import h2  # httpx.AsyncClient(http2=True) needs it
+    import httpx
+    from qingcloud.qai.async_connection import QAIAsyncConnection
+except ImportError:
+    httpx = None
+
+
+@unittest.skipIf(httpx is None, "httpx with http2 support is not installed")
+class QAIAsyncConnectionTestCase(unittest.TestCase):
+
+    async def _connection(self, handler):
+        conn = QAIAsyncConnection("AKID", "SECRETKEY", "xb3", host="ai.example.com")
+        await conn.close()
+        conn._session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return conn
+
+    def test_send_request(self):
+        def handler(request):
+            return httpx.Response(200, content=(request.method + " " + request.url.path).encode())
+
+        async def run():
+            async with await self._connection(handler) as conn:
+                return await conn.get_user_info(), await conn.send_requests([
+                    {"url": "/aicp/a", "method": "GET", "params": {"zone": "xb3"}},
+                    {"url": "/aicp/b", "method": "POST", "params": {"zone": "xb3"}, "body": {"k": "v"}},
+                ])
+
+        user_info, results = asyncio.run(run())
+        self.assertEqual(b"GET /aicp/user/workgroups", user_info)
+        self.assertEqual([b"GET /aicp/a", b"POST /aicp/b"], results)
+
+    def test_send_request_timeout(self):
+        def handler(request):
+            raise httpx.ConnectTimeout("timed out", request=request)
+
+        async def run():
+            async with await self._connection(handler) as conn:
+                await conn.get_user_info()
+
+        with self.assertRaises(Exception) as cm:
+            asyncio.run(run())
+        self.assertEqual("Connection timed out.", str(cm.exception))
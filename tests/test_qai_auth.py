@@ -0,0 +1,106 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import hmac
+import unittest
+from hashlib import sha256
+from qingcloud.qai.connection import QAISignatureAuthHandler, hex_encode_md5_hash
+
+ACCESS_KEY_ID = "AKID"
+SECRET_ACCESS_KEY = "SECRETKEY"
+URL = "/aicp/trains/namespaces/ALL/trains"
+SIGNED_QUERY = "access_key_id=AKID&limit=100&reverse=False&status=Failed&status=Running&zone=xb3" \
+               "&signature=zdDRBb%2Bk0fWsO02249xpRqVjvvKqiuKNH46dRnpTl9I%3D"
+
+
+class QAISignatureAuthTestCase(unittest.TestCase):
+
+    def _params(self):
+        return {"zone": "xb3", "limit": 100, "reverse": False,
+                "status": ["Running", "Failed"]}
+
+    def test_generate_signature(self):
+        self.assertEqual(SIGNED_QUERY, QAISignatureAuthHandler.generate_signature(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, self._params()))
+
+    def test_generate_signature_with_bytes_key(self):
+        self.assertEqual(SIGNED_QUERY, QAISignatureAuthHandler.generate_signature(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY.encode("utf-8"), self._params()))
+
+    def test_generate_signature_quotes_values(self):
+        signed = QAISignatureAuthHandler.generate_signature(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY,
+            {"zone": "xb3", "name": "a b&c~", "status": ["x/y", "\u8bad\u7ec3"]})
+        self.assertTrue(signed.startswith(
+            "access_key_id=AKID&name=a%20b%26c~&status=x%2Fy&status=%E8%AE%AD%E7%BB%83&zone=xb3&signature="))
+
+    def test_generate_signature_keeps_params(self):
+        params = self._params()
+        QAISignatureAuthHandler.generate_signature("GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, params)
+        self.assertEqual(self._params(), params)
+
+    def test_prepare_signer(self):
+        sign = QAISignatureAuthHandler.prepare_signer("GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY,
+                                                      {"zone": "xb3", "reverse": False, "name": None})
+        self.assertEqual(SIGNED_QUERY, sign({"limit": 100, "status": ["Running", "Failed"], "owner": None}))
+        self.assertEqual(QAISignatureAuthHandler.generate_signature(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, {"zone": "xb3", "reverse": False}), sign())
+
+    def test_prepare_signer_matches_generate_signature(self):
+        for static_params, params in (({"zone": "xb3", "status": []}, None),
+                                      ({"zone": "xb3"}, {"status": [], "name": "a b"}),
+                                      ({"status": ["b", "a"]}, {"zone": "xb3", "endpoints": []})):
+            sign = QAISignatureAuthHandler.prepare_signer("GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY,
+                                                          static_params)
+            self.assertEqual(QAISignatureAuthHandler.generate_signature(
+                "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, {**static_params, **(params or {})}), sign(params))
+
+    def test_generate_signature_with_keys(self):
+        params = self._params()
+        params["owner"] = None
+        self.assertEqual(SIGNED_QUERY, QAISignatureAuthHandler.generate_signature_with_keys(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY,
+            ("limit", "name", "owner", "reverse", "status", "zone"), params))
+
+    def test_generate_signature_with_hmac_key(self):
+        sk = hmac.new(SECRET_ACCESS_KEY.encode("utf-8"), digestmod=sha256)
+        for _ in range(2):
+            self.assertEqual(SIGNED_QUERY, QAISignatureAuthHandler.generate_signature(
+                "GET", URL, ACCESS_KEY_ID, sk, self._params()))
+
+    def test_generate_signature_skips_none(self):
+        params = self._params()
+        params["owner"] = None
+        self.assertEqual(SIGNED_QUERY, QAISignatureAuthHandler.generate_signature(
+            "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, params))
+
+    def test_hex_encode_md5_hash(self):
+        self.assertEqual(b"d41d8cd98f00b204e9800998ecf8427e", hex_encode_md5_hash(""))
+        self.assertEqual(b"5eb63bbbe01eeed093cb22bb8f5acdc3", hex_encode_md5_hash("hello world"))
+
+    def test_generate_signature_equal_list_values(self):
+        # Values that compare equal but render differently must each be signed as given.
+        for values, expected in (([True, 0], "ids=0&ids=True"), ([1, 0], "ids=0&ids=1"),
+                                 ([2.0], "ids=2.0"), ([2], "ids=2")):
+            signed = QAISignatureAuthHandler.generate_signature(
+                "GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY, {"ids": values})
+            self.assertTrue(signed.startswith("access_key_id=AKID&" + expected + "&signature="))
+
+    def test_prepare_signer_static_only_pieces(self):
+        sign = QAISignatureAuthHandler.prepare_signer("GET", URL, ACCESS_KEY_ID, SECRET_ACCESS_KEY,
+                                                      {"zone": "xb3", "endpoints": [], "owner": None})
+        self.assertTrue(sign({"status": ["b", "a"]}).startswith(
+            "access_key_id=AKID&status=a&status=b&zone=xb3&signature="))
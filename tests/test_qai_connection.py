@@ -0,0 +1,155 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import mock
+import requests
+import socket
+import threading
+import unittest
+from qingcloud.qai.connection import QAIConnection, QAISignatureAuthHandler
+
+
+class QAIConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(QAIConnectionTestCase, self).setUp()
+        self.conn = QAIConnection("AKID", "SECRETKEY", "xb3", host="ai.example.com")
+        self.conn._session = mock.Mock()
+        self.conn._session.request.side_effect = \
+            lambda method, path, **kwargs: mock.Mock(content=(method + " " + path.split("?")[0]).encode())
+
+    def test_send_request(self):
+        self.assertEqual(b"GET https://ai.example.com:443/aicp/user/workgroups",
+                         self.conn.get_user_info())
+        headers = self.conn._session.request.call_args[1]["headers"]
+        self.assertEqual("api", headers["Channel"])
+
+    def test_get_trains_signature(self):
+        self.conn.get_trains(status=["Running", "Failed"], owner="usr-1")
+        path = self.conn._session.request.call_args[0][1]
+        params = {"namespace": "ALL", "zone": "xb3", "name": "", "image_name": "", "reverse": False,
+                  "offset": 0, "limit": 100, "status": ["Running", "Failed"], "owner": "usr-1"}
+        self.assertEqual(QAISignatureAuthHandler.generate_signature(
+            "GET", "/aicp/trains/namespaces/ALL/trains", "AKID", "SECRETKEY", params), path.split("?")[1])
+
+    def test_endpoint_sign_keys(self):
+        calls = []
+        send_request = self.conn.send_request
+
+        def spy(**kwargs):
+            calls.append(kwargs)
+            return send_request(**kwargs)
+
+        self.conn.send_request = spy
+        self.conn.get_user_info()
+        self.conn.get_resource_groups()
+        self.conn.get_share_users(rg_id="rg-1")
+        self.conn.share_resource_group("rg-1")
+        self.conn.remove_shared_resource_group("rg-1", share_user_ids=["usr-2", "usr-1"])
+        self.conn.get_trains(order_by="name", status=["Running"], endpoints=["e"], start_at="2024-01-01",
+                             end_at="2024-01-02", owner="usr-1")
+        self.conn.trains_metrics(["tn-1"])
+        self.assertEqual(7, len(calls))
+        for kwargs, call in zip(calls, self.conn._session.request.call_args_list):
+            self.assertEqual(kwargs["sign_keys"], tuple(sorted(kwargs["params"])))
+            self.assertEqual(QAISignatureAuthHandler.generate_signature(
+                kwargs["method"], kwargs["url"], "AKID", "SECRETKEY", kwargs["params"]),
+                call[0][1].split("?")[1])
+
+    def test_send_request_body(self):
+        self.conn.share_resource_group("rg-1", is_all=0, share_user_ids=["usr-1"])
+        kwargs = self.conn._session.request.call_args[1]
+        self.assertEqual(b'{"is_all":0,"rg_id":"rg-1","share_user_ids":["usr-1"]}', kwargs["data"])
+        self.assertEqual("application/json", kwargs["headers"]["Content-Type"])
+
+        self.conn.get_user_info()
+        kwargs = self.conn._session.request.call_args[1]
+        self.assertIsNone(kwargs["data"])
+        self.assertNotIn("Content-Type", kwargs["headers"])
+
+    def test_send_request_bad_body(self):
+        with self.assertRaises(TypeError):
+            self.conn.send_request(url="/aicp/a", method="POST", params={"zone": "xb3"}, body={"ids": {"x"}})
+        self.assertFalse(self.conn._session.request.called)
+
+    def test_send_requests(self):
+        specs = [
+            {"url": "/aicp/a", "method": "GET", "params": {"zone": "xb3"}},
+            {"url": "/aicp/b", "method": "POST", "params": {"zone": "xb3"}, "body": {"k": "v"}},
+            {"url": "/aicp/c", "method": "DELETE", "params": {"zone": "xb3"}},
+        ]
+        self.assertEqual([b"GET https://ai.example.com:443/aicp/a",
+                          b"POST https://ai.example.com:443/aicp/b",
+                          b"DELETE https://ai.example.com:443/aicp/c"],
+                         self.conn.send_requests(specs))
+        self.assertEqual([], self.conn.send_requests([]))
+
+    def test_send_request_timeout(self):
+        self.conn._session.request.side_effect = requests.exceptions.Timeout()
+        with self.assertRaises(Exception) as cm:
+            self.conn.get_user_info()
+        self.assertEqual("Connection timed out.", str(cm.exception))
+        self.assertIsInstance(cm.exception.__cause__, requests.exceptions.Timeout)
+
+    def test_send_requests_bad_spec(self):
+        with self.assertRaises(TypeError):
+            self.conn.send_requests([
+                {"url": "/aicp/a", "method": "POST", "params": {"zone": "xb3"}, "body": {"k": "v"}},
+                {"url": "/aicp/b", "method": "POST", "params": {"zone": "xb3"}, "body": {"ids": {"x"}}},
+            ])
+        self.assertFalse(self.conn._session.request.called)
+
+    def test_send_requests_failed(self):
+        self.conn._session.request.side_effect = requests.exceptions.Timeout()
+        with self.assertRaises(Exception) as cm:
+            self.conn.send_requests([{"url": "/aicp/a", "method": "GET", "params": {"zone": "xb3"}}])
+        self.assertEqual("Connection timed out.", str(cm.exception))
+        self.assertIsInstance(cm.exception.__cause__, requests.exceptions.Timeout)
+
+
+class QAIConnectionSocketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(QAIConnectionSocketTestCase, self).setUp()
+        # A server that accepts connections but never replies.
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(5)
+        self.accepted = []
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+
+    def tearDown(self):
+        self.server.close()
+        for conn in self.accepted:
+            conn.close()
+        super(QAIConnectionSocketTestCase, self).tearDown()
+
+    def _accept(self):
+        while True:
+            try:
+                self.accepted.append(self.server.accept()[0])
+            except OSError:
+                return
+
+    def test_send_request_read_timeout(self):
+        conn = QAIConnection("AKID", "SECRETKEY", "xb3", host="127.0.0.1",
+                             port=self.server.getsockname()[1], protocol="http")
+        with self.assertRaises(Exception) as cm:
+            conn.send_request(url="/aicp/a", method="GET", params={"zone": "xb3"}, timeout=0.3)
+        self.assertEqual("Connection timed out.", str(cm.exception))
+        self.assertIsInstance(cm.exception.__cause__, requests.exceptions.ReadTimeout)
+        self.assertEqual(1, len(self.accepted))